@@ -41,9 +41,18 @@ _build/
 
     # Non-Meson-managed
     cache/                      Download cache for populate-depot.py
+    ccache/                     ccache(1) directory shared by all builds
+    sccache/                    sccache(1) directory shared by host builds
+    container-cache/            Persistent caches for OCI containers
+        sniper/                 Caches for sniper
+            apt/                Mounted on /var/cache/apt/archives
+            xdg/                $XDG_CACHE_HOME (pip, etc.)
+            pull.log            Output of the last docker/podman pull
+        ...
     containers/                 Container images for testing
         scout_sysroot/          scout sysroot for builds
     host-artifacts/             Additional test logs
+    .trash/                     Old directories being deleted
     scout-DESTDIR/              Staging directory for scout builds
     scout-layered/              Staging directory for scout-on-soldier
     scout-relocatable/          Staging directory for relocatable scout builds
@@ -54,20 +63,45 @@ _build/
     doc/                        Build for host system with gtk-doc and pandoc
     host-no-asan/               No AddressSanitizer, for use with valgrind
     i386/                       Build for host system for i386
+
+The host builds, the scout builds and the builds for each other suite
+run in parallel. To avoid oversubscribing the CPU, the number of jobs
+given by --jobs (default: number of CPUs) is divided between them, and
+each ninja also stops starting new jobs if the load average exceeds it.
 """
 
 import argparse
+import atexit
+import concurrent.futures
+import fcntl
+import functools
 import grp
+import hashlib
 import logging
 import os
 import shutil
+import signal
 import subprocess
 import sys
 import tempfile
+import threading
+import time
+import uuid
 
 from contextlib import suppress
 from pathlib import Path
-from typing import List, Union
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
 
 logger = logging.getLogger('many-builds')
@@ -77,39 +111,64 @@ SYSROOT_TAR = (
 )
 
 
+# From <linux/fs.h>
+FICLONE = 0x40049409
+
+
+def reflink_or_copy2(src: str, dst: str) -> str:
+    '''
+    Copy src to dst like shutil.copy2(), but share the data blocks
+    instead of copying them if the filesystem supports it.
+    '''
+    try:
+        with open(src, 'rb') as reader, open(dst, 'wb') as writer:
+            fcntl.ioctl(writer.fileno(), FICLONE, reader.fileno())
+    except OSError:
+        return shutil.copy2(src, dst)
+
+    shutil.copystat(src, dst)
+    return dst
+
+
+class JobCancelled(Exception):
+    pass
+
+
 class Environment:
     def __init__(
         self,
         builddir_parent: Union[str, os.PathLike] = '_build',
         docker: bool = False,
+        jobs: int = 0,
+        keep_going: bool = False,
         podman: bool = False,
         srcdir: Union[str, os.PathLike] = '.',
     ) -> None:
         self.builddir_parent = Path(builddir_parent)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.keep_going = keep_going
         self.srcdir = Path(srcdir)
 
         self.builddir_parent.mkdir(exist_ok=True)
 
+        # Both of these have all symlinks resolved, so they can be
+        # bind-mounted into containers at the same path
         self.abs_srcdir = self.srcdir.resolve()
         self.abs_builddir_parent = self.builddir_parent.resolve()
 
         self.podman = podman
-
-        if docker:
-            groups = set(os.getgroups())
-            groups.add(os.geteuid())
-
-            try:
-                docker_gid = grp.getgrnam('docker').gr_gid
-            except KeyError:
-                self.docker = ['sudo', 'docker']
-            else:
-                if docker_gid in groups:
-                    self.docker = ['docker']
-                else:
-                    self.docker = ['sudo', 'docker']
-        else:
-            self.docker = []
+        self.use_docker = docker
+        self._local = threading.local()
+        # subprocess => thread forwarding its output with a prefix
+        self.forwarders: Dict[
+            'subprocess.Popen[bytes]', threading.Thread
+        ] = {}
+        self.output_lock = threading.Lock()
+        # Subprocesses started by parallel jobs, and whether they have
+        # been cancelled because another job failed
+        self.cancelled = threading.Event()
+        self.children: Set['subprocess.Popen[bytes]'] = set()
+        self.children_lock = threading.Lock()
 
         self.populate_depot = (
             self.abs_srcdir / 'subprojects' / 'container-runtime'
@@ -117,10 +176,97 @@ class Environment:
         )
 
         self.cache = self.abs_builddir_parent / 'cache'
+        self.container_cache = self.abs_builddir_parent / 'container-cache'
         self.containers = self.abs_builddir_parent / 'containers'
 
-        real_builddir = self.abs_builddir_parent.resolve()
+        # Meson automatically uses ccache if it is in the PATH, so all we
+        # need to do is to make the builds share a cache directory,
+        # and make the cache keys independent of the build directory.
+        # These variables are harmless if ccache is not installed, so
+        # they are always passed into containers, where we cannot easily
+        # check for it.
+        self.compiler_cache_env: Dict[str, str] = {
+            'CCACHE_BASEDIR': str(self.abs_srcdir),
+            'CCACHE_COMPILERCHECK': 'content',
+            'CCACHE_DIR': str(self.abs_builddir_parent / 'ccache'),
+        }
+        self.host_env = dict(os.environ)
+
+        # Meson prefers sccache over ccache if both are available.
+        # sccache is not in the SDK images, so it is only used on the host.
+        self.sccache = shutil.which('sccache')
+
+        if self.sccache:
+            self.host_env['SCCACHE_CACHE_SIZE'] = '20G'
+            self.host_env['SCCACHE_DIR'] = str(
+                self.abs_builddir_parent / 'sccache'
+            )
+        elif shutil.which('ccache'):
+            self.host_env.update(self.compiler_cache_env)
+
+        # run-in-sysroot.py puts the sysroot's ccache in the PATH
+        self.sysroot_env = dict(self.host_env, **self.compiler_cache_env)
+
+        # Only used for commands that are not part of a parallel job,
+        # otherwise several containers would be competing for the terminal
+        self.tty = sys.stdout.isatty() and sys.stderr.isatty()
+
+        self.oci_images = {
+            'scout': 'registry.gitlab.steamos.cloud/steamrt/scout/sdk:beta',
+            'soldier': (
+                'registry.gitlab.steamos.cloud/steamrt/soldier/sdk:beta'
+            ),
+            'sniper': 'registry.gitlab.steamos.cloud/steamrt/sniper/sdk:beta',
+            'medic': '',
+            'steamrt5': '',
+        }
+
+        # suite or '' for the host system => output of meson --version
+        self.meson_versions: Dict[str, str] = {}
+
+        # suite => ID of a long-running container, or '' if we could not
+        # start one and must use a new container per command
+        self.suite_containers: Dict[str, str] = {}
+        # suite => lock held while its container is being started, so
+        # that different suites' containers can start at the same time
+        self.suite_container_locks: Dict[str, threading.Lock] = {}
+        # Protects suite_containers and suite_container_locks
+        self.suite_containers_lock = threading.Lock()
+
+    # The properties below are only computed when a command needs
+    # containers, and are tuples so they can be reused for every command
+    # without copying.
+
+    @functools.cached_property
+    def docker(self) -> Tuple[str, ...]:
+        if not self.use_docker:
+            return ()
+
+        groups = set(os.getgroups())
+        groups.add(os.geteuid())
+
+        try:
+            docker_gid = grp.getgrnam('docker').gr_gid
+        except KeyError:
+            pass
+        else:
+            if docker_gid in groups:
+                return ('docker',)
+
+        # Ask for the password now, once, rather than from several
+        # parallel jobs at the same time
+        subprocess.run(['sudo', '-v'], check=True)
+        return ('sudo', 'docker')
+
+    @functools.cached_property
+    def oci_cli(self) -> Tuple[str, ...]:
+        if self.podman:
+            return ('podman',)
+        else:
+            return self.docker
 
+    @functools.cached_property
+    def oci_run_argv(self) -> Tuple[str, ...]:
         oci_run_args = [
             '--rm',
             '-i',
@@ -135,41 +281,59 @@ class Environment:
             '--tmpfs', '/run',
             '--tmpfs', '/run/host',
             '-v', '{}:{}'.format(self.abs_srcdir, self.abs_srcdir),
-            '-v', '{}:{}'.format(real_builddir, real_builddir),
+            '-v', '{}:{}'.format(
+                self.abs_builddir_parent, self.abs_builddir_parent,
+            ),
             '-w', str(self.abs_srcdir),
         ]
 
-        if sys.stdout.isatty() and sys.stderr.isatty():
-            oci_run_args.append('-t')
-
-        if real_builddir != self.abs_builddir_parent:
-            oci_run_args.extend([
-                '-v', '{}:{}'.format(
-                    real_builddir,
-                    self.abs_builddir_parent,
-                ),
-            ])
-
-        self.oci_images = {
-            'scout': 'registry.gitlab.steamos.cloud/steamrt/scout/sdk:beta',
-            'soldier': (
-                'registry.gitlab.steamos.cloud/steamrt/soldier/sdk:beta'
-            ),
-            'sniper': 'registry.gitlab.steamos.cloud/steamrt/sniper/sdk:beta',
-            'medic': '',
-            'steamrt5': '',
-        }
+        for var, val in sorted(self.compiler_cache_env.items()):
+            oci_run_args.extend(['-e', f'{var}={val}'])
 
         if self.podman:
-            self.oci_run_argv = ['podman', 'run'] + oci_run_args
+            return ('podman', 'run', *oci_run_args)
         elif self.docker:
-            self.oci_run_argv = self.docker + [
+            return (
+                *self.docker,
                 'run',
                 '-e', 'HOME={}'.format(Path.home()),
                 '-u', '{}:{}'.format(os.geteuid(), os.getegid()),
-            ] + oci_run_args
+                *oci_run_args,
+            )
         else:
-            self.oci_run_argv = []
+            return ()
+
+    @functools.cached_property
+    def oci_exec_argv(self) -> Tuple[str, ...]:
+        return (*self.oci_cli, 'exec', '-i', '-w', str(self.abs_srcdir))
+
+    @functools.cached_property
+    def oci_suite_run_argv(self) -> Dict[str, Tuple[str, ...]]:
+        '''
+        suite => self.oci_run_argv with suite-specific options appended
+        '''
+        ret: Dict[str, Tuple[str, ...]] = {}
+
+        for suite, image in self.oci_images.items():
+            if not image:
+                continue
+
+            # The build directory parent is already mounted at the
+            # same path, so we only need an extra mount for apt
+            suite_cache = self.container_cache / suite
+            (suite_cache / 'apt' / 'partial').mkdir(
+                parents=True, exist_ok=True,
+            )
+            (suite_cache / 'xdg').mkdir(parents=True, exist_ok=True)
+            ret[suite] = (
+                *self.oci_run_argv,
+                '-v', '{}:/var/cache/apt/archives'.format(
+                    suite_cache / 'apt',
+                ),
+                '-e', 'XDG_CACHE_HOME={}'.format(suite_cache / 'xdg'),
+            )
+
+        return ret
 
     def populate_depots(self):
         with tempfile.TemporaryDirectory() as empty_depot_template:
@@ -184,7 +348,10 @@ class Environment:
                 else:
                     version = 'latest-container-runtime-public-beta'
 
-                subprocess.run(
+                # Always run populate-depot.py: the versions are moving
+                # aliases, and its download cache avoids fetching the
+                # same build again
+                self.run(
                     [
                         self.populate_depot,
                         '--cache', self.cache,
@@ -203,17 +370,34 @@ class Environment:
         self,
         suite: str,
         argv: List[str],
-        check: bool = True
-    ) -> None:
-        if self.oci_run_argv:
-            subprocess.run(
-                self.oci_run_argv + [self.oci_images[suite]] + argv,
-                check=check,
-            )
+        check: bool = True,
+        stdout: Optional[int] = None,
+    ) -> 'subprocess.CompletedProcess[bytes]':
+        in_job = self.current_job() is not None
+
+        if self.oci_cli:
+            if self.tty and not in_job and stdout is None:
+                maybe_tty: Tuple[str, ...] = ('-t',)
+            else:
+                maybe_tty = ()
+
+            container = self.get_suite_container(suite)
+
+            if container:
+                cmd = [*self.oci_exec_argv, *maybe_tty, container, *argv]
+            else:
+                cmd = [
+                    *self.oci_suite_run_argv[suite],
+                    *maybe_tty,
+                    self.oci_images[suite],
+                    *argv,
+                ]
+
+            return self.run(cmd, check=check, stdout=stdout)
         else:
             sysroot = self.containers / (suite + '_sysroot')
             tarball = self.cache / SYSROOT_TAR.format(suite)
-            subprocess.run(
+            return self.run(
                 [
                     str(self.abs_srcdir / 'build-aux' / 'run-in-sysroot.py'),
                     '--srcdir', str(self.srcdir),
@@ -221,10 +405,372 @@ class Environment:
                     '--sysroot', str(sysroot),
                     '--tarball', str(tarball),
                     '--',
-                ] + argv,
+                    *argv,
+                ],
                 check=check,
+                env=self.sysroot_env,
+                stdout=stdout,
+            )
+
+    def get_suite_container(self, suite: str) -> str:
+        '''
+        Return the ID of a long-running container for suite, starting it
+        if necessary, so that each command only needs "exec" instead of
+        setting up a new container. Return '' if it cannot be started.
+        '''
+        with self.suite_containers_lock:
+            if suite in self.suite_containers:
+                return self.suite_containers[suite]
+
+            lock = self.suite_container_locks.setdefault(
+                suite, threading.Lock(),
+            )
+
+        # Starting the container might need to pull the image, so only
+        # make other jobs for the same suite wait for it
+        with lock:
+            with self.suite_containers_lock:
+                if suite in self.suite_containers:
+                    return self.suite_containers[suite]
+
+            result = subprocess.run(
+                [
+                    *self.oci_suite_run_argv[suite],
+                    '-d',
+                    '--entrypoint', 'sleep',
+                    self.oci_images[suite],
+                    'infinity',
+                ],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+            )
+
+            if result.returncode == 0:
+                container = result.stdout.decode('utf-8').strip()
+            else:
+                logger.warning(
+                    'Unable to start long-running %s container, '
+                    'will use a new container per command',
+                    suite,
+                )
+                container = ''
+
+            with self.suite_containers_lock:
+                if not self.suite_containers:
+                    atexit.register(self.stop_suite_containers)
+
+                self.suite_containers[suite] = container
+
+            return container
+
+    def stop_suite_containers(self) -> None:
+        with self.suite_containers_lock:
+            containers = [c for c in self.suite_containers.values() if c]
+            self.suite_containers.clear()
+
+        if containers:
+            subprocess.run(
+                [*self.oci_cli, 'rm', '-f', *containers],
+                stdout=subprocess.DEVNULL,
             )
 
+    def current_job(self) -> Optional[str]:
+        return getattr(self._local, 'job', None)
+
+    def spawn(
+        self,
+        argv: Sequence[Union[str, os.PathLike]],
+        *,
+        env: Optional[Dict[str, str]] = None,
+        stderr: Optional[int] = None,
+        stdout: Union[None, int, IO[Any]] = None,
+    ) -> 'subprocess.Popen[bytes]':
+        '''
+        Start a subprocess. If we are in a parallel job, it gets its own
+        session and no stdin, unless it is run via sudo; and its output
+        is prefixed with the job name unless redirected elsewhere.
+        '''
+        job = self.current_job()
+
+        if job is None:
+            return subprocess.Popen(
+                argv, env=env, stderr=stderr, stdout=stdout,
+            )
+
+        if stdout is None:
+            forward = True
+            stderr = subprocess.STDOUT
+            stdout = subprocess.PIPE
+        else:
+            forward = False
+
+        # sudo needs the controlling terminal to ask for a password, and
+        # by default its cached credentials are only valid for the same
+        # terminal, so don't take it away
+        detach = os.path.basename(argv[0]) != 'sudo'
+
+        with self.children_lock:
+            if self.cancelled.is_set():
+                raise JobCancelled(f'{job}: cancelled')
+
+            proc = subprocess.Popen(
+                argv,
+                env=env,
+                start_new_session=detach,
+                stderr=stderr,
+                stdin=subprocess.DEVNULL if detach else None,
+                stdout=stdout,
+            )
+            self.children.add(proc)
+
+        if forward:
+            assert proc.stdout is not None
+            forwarder = threading.Thread(
+                target=self.forward_output, args=(job, proc.stdout),
+            )
+            forwarder.start()
+            self.forwarders[proc] = forwarder
+
+        return proc
+
+    def forward_output(self, job: str, reader: IO[bytes]) -> None:
+        prefix = f'[{job}] '
+
+        with reader:
+            for line in reader:
+                text = line.decode('utf-8', 'replace')
+
+                if not text.endswith('\n'):
+                    text += '\n'
+
+                with self.output_lock:
+                    sys.stdout.write(prefix + text)
+                    sys.stdout.flush()
+
+    def wait_for(self, proc: 'subprocess.Popen[bytes]') -> int:
+        returncode = proc.wait()
+
+        with self.children_lock:
+            self.children.discard(proc)
+
+        forwarder = self.forwarders.pop(proc, None)
+
+        if forwarder is not None:
+            forwarder.join()
+
+        return returncode
+
+    def run(
+        self,
+        argv: Sequence[Union[str, os.PathLike]],
+        *,
+        check: bool = True,
+        env: Optional[Dict[str, str]] = None,
+        stderr: Optional[int] = None,
+        stdout: Union[None, int, IO[Any]] = None,
+    ) -> 'subprocess.CompletedProcess[bytes]':
+        '''
+        Equivalent to subprocess.run(), but using spawn().
+        '''
+        proc = self.spawn(argv, env=env, stderr=stderr, stdout=stdout)
+
+        if stdout == subprocess.PIPE:
+            output, _ = proc.communicate()
+        else:
+            output = None
+
+        returncode = self.wait_for(proc)
+
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, proc.args, output)
+
+        return subprocess.CompletedProcess(proc.args, returncode, output)
+
+    def run_parallel(self, jobs: Dict[str, Callable[[], object]]) -> None:
+        '''
+        Run each of the jobs in its own thread, wait for all of them
+        to finish, and re-raise the first failure.
+        '''
+
+        def run_job(name: str, job: Callable[[], object]) -> None:
+            self._local.job = name
+
+            try:
+                job()
+            finally:
+                self._local.job = None
+
+        if not jobs:
+            return
+
+        # Decide whether docker needs sudo before starting any jobs,
+        # while we are the only thread using the terminal
+        self.docker
+
+        first_error: Optional[BaseException] = None
+        self.cancelled.clear()
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(jobs),
+        ) as executor:
+            futures = {
+                executor.submit(run_job, name, job): name
+                for name, job in jobs.items()
+            }
+
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    e = future.exception()
+
+                    if e is None:
+                        continue
+
+                    if first_error is None:
+                        first_error = e
+
+                        if not self.keep_going:
+                            self.cancel_jobs()
+
+                    # Don't log the errors caused by cancellation
+                    if e is first_error or not self.cancelled.is_set():
+                        logger.error('%s: %s', futures[future], e)
+            except BaseException:
+                # Most likely KeyboardInterrupt, which most children don't
+                # receive because they are in a new session
+                self.cancel_jobs()
+                raise
+
+        if first_error is not None:
+            raise first_error
+
+    def cancel_jobs(self) -> None:
+        '''
+        Stop parallel jobs from starting new subprocesses, and terminate
+        the ones that are already running.
+        '''
+        with self.children_lock:
+            self.cancelled.set()
+            children = list(self.children)
+
+        for proc in children:
+            self.kill_child(proc, signal.SIGTERM)
+
+        deadline = time.monotonic() + 5
+
+        for proc in children:
+            try:
+                proc.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                self.kill_child(proc, signal.SIGKILL)
+
+    def kill_child(
+        self,
+        proc: 'subprocess.Popen[bytes]',
+        sig: int,
+    ) -> None:
+        '''
+        Send sig to a child started by spawn(). Most children are the
+        leader of their own process group, so signal the whole group,
+        including any compilers started by ninja.
+        '''
+        with suppress(ProcessLookupError):
+            if os.getpgid(proc.pid) == proc.pid:
+                os.killpg(proc.pid, sig)
+            else:
+                proc.send_signal(sig)
+
+    def start_sccache(self) -> None:
+        '''
+        Start the sccache server before the parallel builds need it,
+        so that they all share the same server.
+        '''
+        if self.sccache:
+            # This fails if the server is already running, which is fine
+            subprocess.run(
+                [self.sccache, '--start-server'],
+                env=self.host_env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+
+    def show_sccache_stats(self) -> None:
+        if self.sccache:
+            subprocess.run(
+                [self.sccache, '--show-stats'],
+                env=self.host_env,
+            )
+
+    def discard(self, path: Path) -> None:
+        '''
+        Move path out of the way, then delete it in the background.
+        '''
+        trash = self.abs_builddir_parent / '.trash'
+        trash.mkdir(exist_ok=True)
+
+        try:
+            os.rename(path, trash / uuid.uuid4().hex)
+        except FileNotFoundError:
+            return
+        except OSError:
+            # For example EXDEV if path is on a different filesystem
+            shutil.rmtree(path)
+            return
+
+        # Not a daemon thread, so that we finish deleting before exit.
+        # If we exec() before then, the next call will clean up.
+        threading.Thread(target=self.empty_trash, args=(trash,)).start()
+
+    @staticmethod
+    def empty_trash(trash: Path) -> None:
+        for entry in trash.iterdir():
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def run_ninja_on_host(
+        self,
+        builddirs: Sequence[str],
+        args: List[str],
+        *,
+        jobs: int = 0,
+        optional: Sequence[str] = (),
+    ) -> None:
+        '''
+        Run ninja in each of the builddirs concurrently, sharing
+        jobs (default: self.jobs) between them so that they do not
+        oversubscribe the CPU.
+        Failures in the optional builddirs are ignored.
+        '''
+        share = max(1, (jobs or self.jobs) // len(builddirs))
+        procs = []
+
+        for builddir in builddirs:
+            procs.append(
+                self.spawn(
+                    [
+                        'ninja',
+                        '-j', str(share),
+                        '-l', str(self.jobs),
+                        '-C', str(self.builddir_parent / builddir),
+                    ] + args,
+                    env=self.host_env,
+                )
+            )
+
+        for builddir, proc in zip(builddirs, procs):
+            returncode = self.wait_for(proc)
+
+            if returncode != 0 and builddir not in optional:
+                raise subprocess.CalledProcessError(returncode, proc.args)
+
+    def get_parallel_suites(self) -> List[str]:
+        '''
+        Return the suites other than scout that we build for. scout is
+        handled separately by scout-builds.py.
+        '''
+        return [
+            suite for suite, image in self.oci_images.items()
+            if suite != 'scout' and image
+        ]
+
     def run_scout_builds(self, verb: str, args: List[str]) -> None:
         self.run_in_suite(
             'scout',
@@ -236,15 +782,81 @@ class Environment:
             ] + args,
         )
 
+    def pull(self, suite: str) -> None:
+        log = self.container_cache / suite / 'pull.log'
+        log.parent.mkdir(parents=True, exist_ok=True)
+        logger.info('Pulling %s, see %s for details', suite, log)
+
+        with open(log, 'w') as writer:
+            self.run(
+                [*self.oci_cli, 'pull', self.oci_images[suite]],
+                check=True,
+                stdout=writer,
+                stderr=subprocess.STDOUT,
+            )
+
     def deps(self, args: List[str]) -> None:
-        self.populate_depots()
+        jobs: Dict[str, Callable[[], object]] = {
+            'depots': self.populate_depots,
+        }
 
-        for suite, image in self.oci_images.items():
-            if image:
-                if self.podman:
-                    subprocess.run(['podman', 'pull', image], check=True)
-                elif self.docker:
-                    subprocess.run(self.docker + ['pull', image], check=True)
+        if self.oci_cli:
+            for suite, image in self.oci_images.items():
+                if image:
+                    jobs[suite] = functools.partial(self.pull, suite)
+
+        self.run_parallel(jobs)
+
+    def get_meson_version(self, in_suite: str = '') -> str:
+        if in_suite in self.meson_versions:
+            return self.meson_versions[in_suite]
+
+        argv = ['meson', '--version']
+
+        if in_suite:
+            result = self.run_in_suite(
+                in_suite, argv, check=False, stdout=subprocess.PIPE,
+            )
+        else:
+            result = self.run(
+                argv, check=False, env=self.host_env, stdout=subprocess.PIPE,
+            )
+
+        version = result.stdout.decode('utf-8', 'replace').strip()
+        self.meson_versions[in_suite] = version
+        return version
+
+    def setup_fingerprint(self, args: List[str], in_suite: str = '') -> str:
+        '''
+        Return a string that changes whenever "meson setup" with these
+        args would give a different result, including the Meson version,
+        the suite or host system where it runs, and the contents of
+        any cross or native files.
+        '''
+        h = hashlib.sha256()
+        h.update(repr(args).encode('utf-8'))
+        h.update(repr((
+            in_suite,
+            self.oci_images.get(in_suite, ''),
+            self.get_meson_version(in_suite),
+        )).encode('utf-8'))
+        machine_file = False
+
+        for arg in args:
+            path = ''
+
+            if machine_file:
+                path = arg
+            elif arg.startswith(('--cross-file=', '--native-file=')):
+                path = arg.split('=', 1)[1]
+
+            machine_file = arg in ('--cross-file', '--native-file')
+
+            if path:
+                with suppress(OSError):
+                    h.update((self.srcdir / path).read_bytes())
+
+        return h.hexdigest()
 
     def setup_one(
         self,
@@ -255,22 +867,44 @@ class Environment:
         in_suite: str = '',
     ) -> None:
         d = self.abs_builddir_parent / subdir
+        stamp = d / '.many-builds-fingerprint'
+        fingerprint = self.setup_fingerprint(args, in_suite)
+
+        def run_meson_setup(extra: List[str], check: bool) -> int:
+            argv = [
+                'meson',
+                'setup',
+                str(d),
+            ] + extra + args
+
+            if in_suite:
+                return self.run_in_suite(
+                    in_suite, argv, check=check,
+                ).returncode
+            else:
+                return self.run(
+                    argv, check=check, env=self.host_env,
+                ).returncode
 
         if (d / 'meson-private' / 'coredata.dat').exists():
-            maybe_wipe = ['--wipe']
-        else:
-            maybe_wipe = []
+            with suppress(FileNotFoundError):
+                if stamp.read_text() == fingerprint:
+                    logger.info('%s is already set up', subdir)
+                    return
 
-        argv = [
-            'meson',
-            'setup',
-            str(d),
-        ] + maybe_wipe + args
+                stamp.unlink()
 
-        if in_suite:
-            self.run_in_suite(in_suite, argv, check=check)
+            # Reconfiguring keeps the existing build tree, but fails if
+            # it is incompatible, for example after a Meson upgrade
+            returncode = run_meson_setup(['--reconfigure'], check=False)
+
+            if returncode != 0:
+                returncode = run_meson_setup(['--wipe'], check=check)
         else:
-            subprocess.run(argv, check=check)
+            returncode = run_meson_setup([], check=check)
+
+        if returncode == 0:
+            stamp.write_text(fingerprint)
 
     def setup(self, args: List[str]) -> None:
         dev_build = [
@@ -290,97 +924,88 @@ class Environment:
             '-Db_sanitize=address,undefined',
         ]
 
-        self.setup_one(
-            'host',
-            asan_dev_build + [
-                ('-Dtest_containers_dir='
-                 + str(self.abs_builddir_parent / 'containers')),
-            ] + args,
-        )
+        def setup_host() -> None:
+            self.setup_one(
+                'host',
+                asan_dev_build + [
+                    ('-Dtest_containers_dir='
+                     + str(self.abs_builddir_parent / 'containers')),
+                ] + args,
+            )
 
-        self.setup_one(
-            'i386',
-            asan_dev_build + [
-                '-Dmultiarch_tuple=i386-linux-gnu',
-                '--cross-file=build-aux/meson/i386.txt',
-                '--libdir=lib/i386-linux-gnu',
-            ] + args,
-            # Host system doesn't necessarily have an i386 toolchain
-            check=False,
-        )
+            self.setup_one(
+                'i386',
+                asan_dev_build + [
+                    '-Dmultiarch_tuple=i386-linux-gnu',
+                    '--cross-file=build-aux/meson/i386.txt',
+                    '--libdir=lib/i386-linux-gnu',
+                ] + args,
+                # Host system doesn't necessarily have an i386 toolchain
+                check=False,
+            )
 
-        self.setup_one(
-            'host-no-asan',
-            dev_build + [
-                ('-Dtest_containers_dir='
-                 + str(self.abs_builddir_parent / 'containers')),
-            ] + args,
-        )
+            self.setup_one(
+                'host-no-asan',
+                dev_build + [
+                    ('-Dtest_containers_dir='
+                     + str(self.abs_builddir_parent / 'containers')),
+                ] + args,
+            )
 
-        self.setup_one(
-            'coverage',
-            dev_build + [
-                '-Db_coverage=true',
-            ] + args,
-        )
+            self.setup_one(
+                'coverage',
+                dev_build + [
+                    '-Db_coverage=true',
+                ] + args,
+            )
 
-        self.setup_one(
-            'doc',
-            [
-                '-Dgtk_doc=enabled',
-                '-Dman=enabled',
-                '-Dpressure_vessel=true',
-            ] + args,
-        )
+            self.setup_one(
+                'doc',
+                [
+                    '-Dgtk_doc=enabled',
+                    '-Dman=enabled',
+                    '-Dpressure_vessel=true',
+                ] + args,
+            )
 
-        self.setup_one(
-            'clang',
-            asan_dev_build + [
-                '--native-file=build-aux/meson/clang.txt',
-                # Workaround for
-                # https://github.com/mesonbuild/meson/issues/13211
-                '-Dintrospection=disabled',
-            ] + args,
-        )
+            self.setup_one(
+                'clang',
+                asan_dev_build + [
+                    '--native-file=build-aux/meson/clang.txt',
+                    # Workaround for
+                    # https://github.com/mesonbuild/meson/issues/13211
+                    '-Dintrospection=disabled',
+                ] + args,
+            )
 
-        for suite, image in self.oci_images.items():
-            if suite == 'scout' or not image:
-                continue
+        jobs: Dict[str, Callable[[], object]] = {'host': setup_host}
 
-            self.setup_one(
+        for suite in self.get_parallel_suites():
+            jobs[suite] = functools.partial(
+                self.setup_one,
                 f'{suite}-x86_64',
                 dev_build + ['-Dwarning_level=2'] + args,
                 in_suite=suite,
             )
 
-        self.run_scout_builds('setup', args)
+        jobs['scout'] = functools.partial(
+            self.run_scout_builds, 'setup', args,
+        )
+        self.run_parallel(jobs)
 
     def clean(self, args: List[str]) -> None:
-        for builddir in ('clang', 'host', 'coverage', 'doc', 'host-no-asan'):
-            subprocess.run(
-                [
-                    'ninja',
-                    '-C', str(self.builddir_parent / builddir),
-                    'clean',
-                ] + args,
-                check=True,
+        def clean_host() -> None:
+            self.run_ninja_on_host(
+                ('clang', 'host', 'coverage', 'doc', 'host-no-asan', 'i386'),
+                ['clean'] + args,
+                optional=('i386',),
             )
 
-        for builddir in ('i386',):
-            subprocess.run(
-                [
-                    'ninja',
-                    '-C', str(self.builddir_parent / builddir),
-                    'clean',
-                ] + args,
-                check=False,
-            )
+        jobs: Dict[str, Callable[[], object]] = {'host': clean_host}
 
-        for suite, image in self.oci_images.items():
-            if suite == 'scout' or not image:
-                continue
-
-            self.run_in_suite(
+        for suite in self.get_parallel_suites():
+            jobs[suite] = functools.partial(
+                self.run_in_suite,
                 suite,
                 [
                     'ninja',
@@ -389,77 +1014,106 @@ class Environment:
                 ] + args,
             )
 
-        self.run_scout_builds('clean', args)
+        jobs['scout'] = functools.partial(
+            self.run_scout_builds, 'clean', args,
+        )
+        self.run_parallel(jobs)
 
     def build(self, args: List[str]) -> None:
-        for builddir in ('host', 'clang'):
-            subprocess.run(
-                [
-                    'ninja',
-                    '-C', str(self.builddir_parent / builddir),
-                ] + args,
-                check=True,
-            )
+        suites = self.get_parallel_suites()
+        # The host, scout and each other suite build at the same time
+        share = max(1, self.jobs // (len(suites) + 2))
+        limits = ['-j', str(share), '-l', str(self.jobs)]
 
-        for suite, image in self.oci_images.items():
-            if suite == 'scout' or not image:
-                continue
+        def build_host() -> None:
+            self.run_ninja_on_host(('host', 'clang'), args, jobs=share)
 
-            self.run_in_suite(
+        jobs: Dict[str, Callable[[], object]] = {'host': build_host}
+
+        for suite in suites:
+            jobs[suite] = functools.partial(
+                self.run_in_suite,
                 suite,
                 [
                     'ninja',
+                    *limits,
                     '-C', str(self.abs_builddir_parent / f'{suite}-x86_64'),
                 ] + args,
             )
 
-        self.run_scout_builds('build', args)
-
-    def test(self, args: List[str]) -> None:
-        subprocess.run(
-            [
-                'meson', 'test',
-                '-C', str(self.builddir_parent / 'clang'),
-            ] + args,
-            check=True,
+        jobs['scout'] = functools.partial(
+            self.run_scout_builds, 'build', limits + args,
         )
+        self.start_sccache()
+        self.run_parallel(jobs)
+        self.show_sccache_stats()
+
+    def test(self, args: List[str], *, exec_last: bool = False) -> None:
+        suites = self.get_parallel_suites()
+        # The host, scout and each other suite test at the same time
+        share = max(1, self.jobs // (len(suites) + 2))
+        limits = ['--num-processes', str(share)]
+
+        def test_host() -> None:
+            self.run(
+                [
+                    'meson', 'test',
+                    *limits,
+                    '-C', str(self.builddir_parent / 'clang'),
+                ] + args,
+                check=True,
+                env=self.host_env,
+            )
 
-        for suite, image in self.oci_images.items():
-            if suite == 'scout' or not image:
-                continue
+        jobs: Dict[str, Callable[[], object]] = {'host': test_host}
 
-            self.run_in_suite(
+        for suite in suites:
+            jobs[suite] = functools.partial(
+                self.run_in_suite,
                 suite,
                 [
                     'meson', 'test',
+                    *limits,
                     '-C', str(self.abs_builddir_parent / f'{suite}-x86_64'),
                 ] + args,
             )
 
-        self.run_scout_builds('test', args)
+        jobs['scout'] = functools.partial(
+            self.run_scout_builds, 'test', limits + args,
+        )
+        self.start_sccache()
+        self.run_parallel(jobs)
 
         # We need to set up the relocatable installation before we can
         # have full test coverage for the host build
         self.install([])
 
         artifacts = self.abs_builddir_parent / 'host-artifacts'
+        self.discard(artifacts)
 
-        with suppress(FileNotFoundError):
-            shutil.rmtree(artifacts)
-
-        subprocess.run(
-            [
-                'env',
-                'AUTOPKGTEST_ARTIFACTS=' + str(artifacts),
-                'meson', 'test',
-                '-C', str(self.builddir_parent / 'host'),
-            ] + args,
-            check=True,
-        )
+        argv = [
+            'env',
+            'AUTOPKGTEST_ARTIFACTS=' + str(artifacts),
+            'meson', 'test',
+            '-C', str(self.builddir_parent / 'host'),
+        ] + args
+
+        if exec_last:
+            # Nothing else to do, so replace ourselves with the last test
+            # run instead of waiting for it. atexit handlers will not run.
+            self.stop_suite_containers()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.execvpe(argv[0], argv, self.host_env)
+
+        subprocess.run(argv, check=True, env=self.host_env)
 
     def install(self, args: List[str]) -> None:
         self.run_scout_builds('install', args)
 
+        pv = self.containers / 'pressure-vessel'
+        self.discard(pv)
+
         subprocess.run(
             [
                 str(self.abs_srcdir / 'build-aux' / 'scout-layered.sh'),
@@ -468,39 +1122,36 @@ class Environment:
             check=True,
         )
 
-        pv = self.containers / 'pressure-vessel'
-
-        with suppress(FileNotFoundError):
-            shutil.rmtree(pv)
-
-        shutil.copytree(self.builddir_parent / 'scout-relocatable', pv)
-        print('To upload to a test machine:')
-        print(
+        shutil.copytree(
+            self.builddir_parent / 'scout-relocatable', pv,
+            copy_function=reflink_or_copy2,
+        )
+        lines = [
+            'To upload to a test machine:',
             'rsync -avzP --delete {}/ '
             'machine:tmp/steam-runtime-tools-tests/'.format(
                 self.builddir_parent
                 / 'scout-DESTDIR/usr/libexec/installed-tests'
                 / 'steam-runtime-tools-0'
-            )
-        )
-        print(
+            ),
             'rsync -avzP --delete {}/ '
             'machine:.../steamapps/common/'
-            'SteamLinuxRuntime_soldier/pressure-vessel/'.format(pv)
-        )
-        print(
+            'SteamLinuxRuntime_soldier/pressure-vessel/'.format(pv),
             'rsync -avzP --delete '
             '{}/scout-layered/SteamLinuxRuntime/ '
             'machine:.../steamapps/common/SteamLinuxRuntime/'.format(
                 self.builddir_parent,
-            )
-        )
+            ),
+        ]
+        sys.stdout.write('\n'.join(lines) + '\n')
 
 
 def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument('--builddir-parent', default='_build')
     parser.add_argument('--docker', action='store_true', default=False)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--keep-going', action='store_true', default=False)
     parser.add_argument('--podman', action='store_true', default=False)
     parser.add_argument('--srcdir', default='.')
     parser.add_argument(
@@ -520,6 +1171,8 @@ def main() -> int:
     env = Environment(
         builddir_parent=args.builddir_parent,
         docker=args.docker,
+        jobs=args.jobs,
+        keep_going=args.keep_going,
         podman=args.podman,
         srcdir=args.srcdir,
     )
@@ -533,7 +1186,7 @@ def main() -> int:
     elif args.command == 'build':
         env.build(args.args)
     elif args.command == 'test':
-        env.test(args.args)
+        env.test(args.args, exec_last=True)
     elif args.command == 'install':
         env.install(args.args)
     elif args.command == 'all':
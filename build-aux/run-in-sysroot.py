@@ -76,7 +76,7 @@ def main():
         os.makedirs(abs_sysroot, exist_ok=True)
         subprocess.check_call([
             'tar',
-            '-xvf',
+            '-xf',
             args.tarball,
             '--exclude=./dev/*',
             '--exclude=dev/*',
@@ -24,6 +24,9 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import argparse
+import concurrent.futures
+import errno
+import functools
 import glob
 import logging
 import os
@@ -41,9 +44,9 @@ else:
     typing      # silence pyflakes
 
 try:
-    from shlex import quote
+    from debian.debfile import DebFile
 except ImportError:
-    from pipes import quote     # noqa
+    DebFile = None
 
 
 logger = logging.getLogger('pressure-vessel-build-relocatable-install')
@@ -89,11 +92,13 @@ PRIMARY_ARCH_DEPENDENCIES = {
     'libselinux1': 'libselinux',
     'libxau6': 'libxau',
 }
+# Suffix to remove from source package versions before downloading them
+SRT_VERSION_SUFFIX = re.compile(r'[+]srt[0-9a-z.]+$')
 # Packages where different binary packages can have different copyright
 # files
-DIFFERENT_COPYRIGHT_FILES = [
+DIFFERENT_COPYRIGHT_FILES = frozenset([
     'util-linux',
-]
+])
 SCRIPTS = [
     'pressure-vessel-locale-gen',
     'pressure-vessel-unruntime',
@@ -115,15 +120,97 @@ LIBEXEC_EXECUTABLES = [
 ]
 
 
-def install(src, dst, mode=0o644):
-    # type: (str, str, int) -> None
+# errno values that mean the kernel can't copy these files for us,
+# and we should fall back to copying through userspace
+COPY_FALLBACK_ERRNOS = frozenset([
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+    errno.EXDEV,
+])
+
+
+def copy_file_contents(src, dst):
+    # type: (str, str) -> None
+    """
+    Copy the contents of src to dst, using copy_file_range() or
+    sendfile() so that the data does not have to pass through Python.
+    """
+
+    with open(src, 'rb') as reader, open(dst, 'wb') as writer:
+        in_fd = reader.fileno()
+        out_fd = writer.fileno()
+        remaining = os.fstat(in_fd).st_size
+        offset = 0
+
+        try:
+            while remaining > 0:
+                if hasattr(os, 'copy_file_range'):
+                    done = os.copy_file_range(in_fd, out_fd, remaining)
+                else:
+                    done = os.sendfile(out_fd, in_fd, offset, remaining)
+
+                if done == 0:
+                    break
+
+                offset += done
+                remaining -= done
+        except OSError as e:
+            if e.errno not in COPY_FALLBACK_ERRNOS:
+                raise
+
+        # Copy whatever is left (normally nothing) the slow way
+        reader.seek(offset)
+        writer.seek(offset)
+        shutil.copyfileobj(reader, writer, 1024 * 1024)
+
+
+def link_dsc(dsc, dest_dir):
+    # type: (str, str) -> None
+    """
+    Hard-link a source package's .dsc file and the files it lists into
+    dest_dir, like `dcmd cp -al dsc dest_dir` but without running dcmd
+    and cp for each package.
+    """
+
+    print('# Linking {} into {}'.format(dsc, dest_dir))
+    src_dir = os.path.dirname(dsc)
+    names = [os.path.basename(dsc)]
+    in_files = False
+
+    with open(dsc) as reader:
+        for line in reader:
+            if line.startswith('Files:'):
+                in_files = True
+            elif in_files and line.startswith(' '):
+                # md5sum size name
+                names.append(line.split()[2])
+            else:
+                in_files = False
+
+    for name in names:
+        src = os.path.join(src_dir, name)
+        dest = os.path.join(dest_dir, name)
+
+        # Like cp -al, succeed if dest is already the same file, and
+        # replace it if it is something else
+        if os.path.lexists(dest):
+            if os.path.exists(dest) and os.path.samefile(src, dest):
+                continue
+
+            os.unlink(dest)
 
-    os.makedirs(os.path.dirname(dst), exist_ok=True)
-    shutil.copy(src, dst)
+        os.link(src, dest)
 
-    if os.path.isdir(dst):
-        dst = os.path.join(dst, os.path.basename(src))
 
+def install(src, dst, mode=0o644):
+    # type: (str, str, int) -> None
+    """
+    Copy src to dst, which must be the full path to the new file
+    in a directory that already exists.
+    """
+
+    copy_file_contents(src, dst)
     os.chmod(dst, mode)
 
 
@@ -132,6 +219,14 @@ def install_exe(src, dst, mode=0o755):
     install(src, dst, mode)
 
 
+@functools.lru_cache(maxsize=None)
+def get_primary_architecture():
+    # type: () -> str
+    return subprocess.check_output([
+        'dpkg', '--print-architecture',
+    ]).decode('utf-8').strip()
+
+
 def v_call(command, **kwargs):
     print('# {}'.format(command))
     return subprocess.call(command, **kwargs)
@@ -283,23 +378,42 @@ def main():
         if os.path.exists(installation):
             raise RuntimeError('--output directory must not already exist')
 
-        os.makedirs(os.path.join(installation, 'bin'), exist_ok=True)
-        os.makedirs(os.path.join(installation, 'libexec'), exist_ok=True)
-        os.makedirs(os.path.join(installation, 'metadata'), exist_ok=True)
+        inst_pkglibexecdir = os.path.join(
+            installation,
+            'libexec',
+            'steam-runtime-tools-0',
+        )
+
+        # Create every directory we will install into up-front, so that
+        # install() doesn't need to check for each file
+        dirs = [
+            os.path.join(installation, 'bin'),
+            os.path.join(installation, 'metadata'),
+            os.path.join(installation, 'sources'),
+            os.path.join(inst_pkglibexecdir, 'shaders'),
+        ]
 
         for arch in architectures:
-            os.makedirs(
-                os.path.join(installation, 'lib', arch.multiarch),
-                exist_ok=True,
+            dirs.append(
+                os.path.join(
+                    installation, 'lib', arch.multiarch,
+                    'steam-runtime-tools-0',
+                )
+            )
+            dirs.append(
+                os.path.join(tmpdir, 'build-relocatable', arch.name, 'lib')
             )
 
+        for d in dirs:
+            os.makedirs(d, exist_ok=True)
+
         for script in SCRIPTS:
             path = os.path.join(args.pv_dir, 'bin', script)
 
             if not os.path.exists(path):
                 path = os.path.join(args.prefix, 'bin', script)
 
-            install_exe(path, os.path.join(installation, 'bin'))
+            install_exe(path, os.path.join(installation, 'bin', script))
 
         for exe in EXECUTABLES:
             path = os.path.join(args.pv_dir, 'bin', exe)
@@ -310,7 +424,7 @@ def main():
             if not os.path.exists(path):
                 path = '/usr/bin/{}'.format(exe)
 
-            install_exe(path, os.path.join(installation, 'bin'))
+            install_exe(path, os.path.join(installation, 'bin', exe))
 
         install(
             os.path.join(srcdir, 'pressure-vessel', 'THIRD-PARTY.md'),
@@ -318,48 +432,49 @@ def main():
             0o644,
         )
 
-        inst_pkglibexecdir = os.path.join(
-            installation,
-            'libexec',
-            'steam-runtime-tools-0',
-        )
-
-        path = os.path.join(
+        pkglibexecdir = os.path.join(
             args.prefix, 'libexec', 'steam-runtime-tools-0',
         )
 
-        if not os.path.exists(path):
-            path = '/usr/libexec/steam-runtime-tools-0'
+        if not os.path.exists(pkglibexecdir):
+            pkglibexecdir = '/usr/libexec/steam-runtime-tools-0'
+
+        have_pkglibexecdir = os.path.exists(pkglibexecdir)
 
         for exe in LIBEXEC_EXECUTABLES:
             install_exe(
-                os.path.join(path, exe),
+                os.path.join(pkglibexecdir, exe),
                 os.path.join(inst_pkglibexecdir, exe),
             )
 
         for arch in architectures:
-            path = os.path.join(
-                args.prefix, 'libexec', 'steam-runtime-tools-0',
-            )
-
-            if not os.path.exists(path):
-                path = '/usr/libexec/steam-runtime-tools-0'
+            path = pkglibexecdir
 
-            if not os.path.exists(path):
+            if not have_pkglibexecdir:
                 package = 'libsteam-runtime-tools-0-helpers'
                 v_check_call([
                     'apt-get',
                     'download',
                     package + ':' + arch.name,
                 ], cwd=tmpdir)
-                v_check_call(
-                    'dpkg-deb -X {}_*_{}.deb build-relocatable'.format(
-                        quote(package),
-                        quote(arch.name),
-                    ),
-                    cwd=tmpdir,
-                    shell=True,
+                [deb] = glob.glob(
+                    os.path.join(
+                        tmpdir,
+                        '{}_*_{}.deb'.format(package, arch.name),
+                    )
                 )
+
+                if DebFile is not None:
+                    print('# Unpacking {}'.format(deb))
+                    DebFile(deb).data.tgz().extractall(
+                        os.path.join(tmpdir, 'build-relocatable'),
+                    )
+                else:
+                    v_check_call(
+                        ['dpkg-deb', '-x', deb, 'build-relocatable'],
+                        cwd=tmpdir,
+                    )
+
                 path = '{}/build-relocatable/{}'.format(tmpdir, path)
 
             for tool in glob.glob(os.path.join(path, arch.multiarch + '-*')):
@@ -382,86 +497,90 @@ def main():
                 os.path.join(inst_pkglibexecdir, arch.multiarch),
             )
 
-        primary_architecture = subprocess.check_output([
-            'dpkg', '--print-architecture',
-        ]).decode('utf-8').strip()
-
-        for arch in architectures:
-            os.makedirs(
-                os.path.join(tmpdir, 'build-relocatable', arch.name, 'lib'),
-                exist_ok=True,
-            )
+        # Each architecture's libraries are captured into a separate
+        # directory, so we can do them all in parallel
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(architectures),
+        ) as executor:
+            futures = []    # type: typing.List[concurrent.futures.Future]
 
-            v_check_call([
-                '{}/{}-capsule-capture-libs'.format(
+            for arch in architectures:
+                capture_libs = os.path.join(
                     inst_pkglibexecdir,
-                    arch.multiarch,
-                ),
-                '--dest={}/build-relocatable/{}/lib'.format(
-                    tmpdir,
-                    arch.name,
-                ),
-                '--no-glibc',
-                'soname:libelf.so.1',
-                'soname:libz.so.1',
-                'no-dependencies:soname:libwaffle-1.so.0',
-            ])
-
-            if arch.name == primary_architecture:
-                v_check_call([
-                    '{}/{}-capsule-capture-libs'.format(
-                        inst_pkglibexecdir,
-                        arch.multiarch,
-                    ),
-                    '--dest={}/build-relocatable/{}/lib'.format(
-                        tmpdir,
-                        arch.name,
-                    ),
+                    arch.multiarch + '-capsule-capture-libs',
+                )
+                captured_dir = os.path.join(
+                    tmpdir, 'build-relocatable', arch.name, 'lib',
+                )
+
+                command = [
+                    capture_libs,
+                    '--dest=' + captured_dir,
                     '--no-glibc',
-                    'soname:libXau.so.6',
-                    'soname:libcap.so.2',
-                    'soname:libgio-2.0.so.0',
-                    'soname:libjson-glib-1.0.so.0',
-                    'soname:libpcre.so.3',
-                    'soname:libselinux.so.1',
-                ])
-
-            for so in glob.glob(
-                os.path.join(
-                    tmpdir,
-                    'build-relocatable',
-                    arch.name,
-                    'lib',
-                    '*.so.*',
-                ),
-            ):
-                install(
-                    so,
-                    os.path.join(
-                        installation, 'lib', arch.multiarch,
-                        'steam-runtime-tools-0',
-                        os.path.basename(so)
-                    )
+                    'soname:libelf.so.1',
+                    'soname:libz.so.1',
+                    'no-dependencies:soname:libwaffle-1.so.0',
+                ]
+
+                if arch.name == get_primary_architecture():
+                    command.extend([
+                        'soname:libXau.so.6',
+                        'soname:libcap.so.2',
+                        'soname:libgio-2.0.so.0',
+                        'soname:libjson-glib-1.0.so.0',
+                        'soname:libpcre.so.3',
+                        'soname:libselinux.so.1',
+                    ])
+
+                print('# {}'.format(command))
+                futures.append(
+                    executor.submit(subprocess.check_call, command),
+                )
+
+            for future in futures:
+                future.result()
+
+        # Copying the libraries is mostly waiting for I/O, so overlap it
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            futures = []
+
+            for arch in architectures:
+                captured_dir = os.path.join(
+                    tmpdir, 'build-relocatable', arch.name, 'lib',
+                )
+                inst_libdir = os.path.join(
+                    installation, 'lib', arch.multiarch,
+                    'steam-runtime-tools-0',
                 )
 
+                for so in glob.glob(os.path.join(captured_dir, '*.so.*')):
+                    futures.append(executor.submit(
+                        install,
+                        so,
+                        os.path.join(inst_libdir, os.path.basename(so)),
+                    ))
+
+            for future in futures:
+                future.result()
+
         source_to_download = set()      # type: typing.Set[str]
         installed_binaries = set()      # type: typing.Set[str]
 
-        get_source = (
-            list(DEPENDENCIES.items())
-            + list(PRIMARY_ARCH_DEPENDENCIES.items())
-        )
-        get_source.append(
-            ('pressure-vessel-relocatable', 'steam-runtime-tools'),
-        )
+        get_source = {
+            **DEPENDENCIES,
+            **PRIMARY_ARCH_DEPENDENCIES,
+            'pressure-vessel-relocatable': 'steam-runtime-tools',
+        }
 
-        for package, source in get_source:
-            if os.path.exists('/usr/share/doc/{}/copyright'.format(package)):
+        for package, source in get_source.items():
+            copyright_file = '/usr/share/doc/{}/copyright'.format(package)
+
+            if os.path.exists(copyright_file):
                 installed_binaries.add(package)
 
                 if source in DIFFERENT_COPYRIGHT_FILES:
                     install(
-                        '/usr/share/doc/{}/copyright'.format(package),
+                        copyright_file,
                         os.path.join(
                             installation,
                             'metadata',
@@ -470,24 +589,13 @@ def main():
                     )
                 else:
                     install(
-                        '/usr/share/doc/{}/copyright'.format(package),
+                        copyright_file,
                         os.path.join(
                             installation,
                             'metadata',
                             '{}.txt'.format(source),
                         ),
                     )
-
-                for expr in set(
-                    v_check_output([
-                        'dpkg-query',
-                        '-W',
-                        '-f', '${source:Package}=${source:Version}\n',
-                        package,
-                    ], universal_newlines=True).splitlines()
-                ):
-                    source_to_download.add(
-                        re.sub(r'[+]srt[0-9a-z.]+$', '', expr))
             else:
                 if source == 'steam-runtime-tools':
                     copyright_file = os.path.join(
@@ -512,20 +620,33 @@ def main():
                 )
                 source_to_download.add(source)
 
+        # Get everything we need to know about the binary packages from a
+        # single dpkg-query call: the first four columns are the
+        # contents of packages.txt, and the last tells us which source
+        # package to download
+        if installed_binaries:
+            dpkg_info = v_check_output([
+                'dpkg-query',
+                '-W',
+                '-f',
+                (r'${binary:Package}\t${Version}\t'
+                 r'${Source}\t${Installed-Size}\t'
+                 r'${source:Package}=${source:Version}\n'),
+            ] + sorted(installed_binaries), universal_newlines=True)
+        else:
+            dpkg_info = ''
+
         with open(
             os.path.join(installation, 'metadata', 'packages.txt'), 'w'
         ) as writer:
             writer.write(
                 '#Package[:Architecture]\t#Version\t#Source\t#Installed-Size\n'
             )
-            writer.flush()
-            v_check_call([
-                'dpkg-query',
-                '-W',
-                '-f',
-                (r'${binary:Package}\t${Version}\t'
-                 r'${Source}\t${Installed-Size}\n'),
-            ] + sorted(installed_binaries), stdout=writer)
+
+            for line in dpkg_info.splitlines():
+                fields, expr = line.rsplit('\t', 1)
+                writer.write(fields + '\n')
+                source_to_download.add(SRT_VERSION_SUFFIX.sub('', expr))
 
         with open(
             os.path.join(installation, 'metadata', 'VERSION.txt'),
@@ -542,11 +663,6 @@ def main():
             for source in sorted(source_to_download):
                 writer.write(source.replace('=', '\t') + '\n')
 
-        shutil.copytree(
-            os.path.join(installation, 'metadata'),
-            os.path.join(installation, 'sources'),
-        )
-
         if args.check_source_directory is None:
             source_should_be_in = os.path.join(installation, 'sources')
         else:
@@ -573,10 +689,11 @@ def main():
                     os.path.exists(cache_filename)
                     and args.check_source_directory is None
                 ):
-                    if v_call([
-                        'dcmd', 'cp', '-al', cache_filename,
-                        source_should_be_in,
-                    ]) != 0:
+                    try:
+                        link_dsc(cache_filename, source_should_be_in)
+                    except OSError as e:
+                        logger.warning('%s', e)
+
                         try:
                             os.remove(filename)
                         except FileNotFoundError:
@@ -595,19 +712,74 @@ def main():
                 raise RuntimeError(
                     'Source code not found in %s', filename)
 
+        # Downloading source code is network-bound, so start it now and
+        # create the binary tarball while we wait for it
+        apt_get = None      # type: typing.Optional[subprocess.Popen]
+        apt_get_command = [
+            'apt-get',
+            '--download-only',
+            '--only-source',
+            'source',
+        ] + list(source_to_download)
+
         if args.check_source_directory is None and source_to_download:
-            try:
-                v_check_call(
-                    [
-                        'apt-get',
-                        '--download-only',
-                        '--only-source',
-                        'source',
-                    ] + list(source_to_download),
-                    cwd=os.path.join(installation, 'sources'),
+            print('# {}'.format(apt_get_command))
+            apt_get = subprocess.Popen(
+                apt_get_command,
+                cwd=os.path.join(installation, 'sources'),
+            )
+
+        if args.archive_versions:
+            tail = '-' + args.version
+        else:
+            tail = ''
+
+        if args.architecture_name is None:
+            bin_arch = 'bin'
+        else:
+            bin_arch = args.architecture_name
+
+        # gzip is single-threaded and dominates the time taken here,
+        # so use pigz if we can, and create both tarballs at once
+        if shutil.which('pigz') is not None:
+            compress = '--use-compress-program=pigz'
+        else:
+            compress = '--gzip'
+
+        bin_tar = ''
+        src_tar = ''
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            futures = []
+
+            if args.archive:
+                bin_tar = os.path.join(
+                    args.archive,
+                    'pressure-vessel{}-{}.tar.gz'.format(tail, bin_arch),
+                )
+                command = [
+                    'tar',
+                    compress,
+                    (r'--transform='
+                     r's,^\(\.\(/\|$\)\)\?,pressure-vessel{}/,').format(
+                        tail,
+                    ),
+                    '--exclude=sources',
+                    '-cf', bin_tar + '.tmp',
+                    '-C', installation,
+                    '.',
+                ]
+                print('# {}'.format(command))
+                futures.append(
+                    executor.submit(subprocess.check_call, command),
                 )
-            except subprocess.CalledProcessError:
-                if args.allow_missing_sources:
+
+            if apt_get is not None:
+                returncode = apt_get.wait()
+
+                if returncode == 0:
+                    pass
+                elif args.allow_missing_sources:
                     logger.warning(
                         'Some source packages could not be downloaded')
                     with open(
@@ -617,78 +789,60 @@ def main():
                         # nothing to write, just create the file
                         pass
                 else:
-                    raise
-
-            if args.cache:
-                for source in source_to_download:
-                    package, version = source.split('=')
-
-                    if ':' in version:
-                        version = version.split(':', 1)[1]
-
-                    filename = os.path.join(
-                        source_should_be_in,
-                        '{}_{}.dsc'.format(package, version),
+                    raise subprocess.CalledProcessError(
+                        returncode, apt_get_command,
                     )
 
-                    if os.path.exists(filename):
-                        v_check_call([
-                            'dcmd', 'cp', '-al', filename, args.cache + '/',
-                        ])
+                if args.cache:
+                    for source in source_to_download:
+                        package, version = source.split('=')
 
-        if args.archive:
-            if args.archive_versions:
-                tail = '-' + args.version
-            else:
-                tail = ''
+                        if ':' in version:
+                            version = version.split(':', 1)[1]
 
-            if args.architecture_name is None:
-                bin_arch = 'bin'
-            else:
-                bin_arch = args.architecture_name
+                        filename = os.path.join(
+                            source_should_be_in,
+                            '{}_{}.dsc'.format(package, version),
+                        )
 
-            bin_tar = os.path.join(
-                args.archive,
-                'pressure-vessel{}-{}.tar.gz'.format(tail, bin_arch),
-            )
+                        if os.path.exists(filename):
+                            link_dsc(filename, args.cache)
 
-            if args.check_source_directory is None:
+            if args.archive and args.check_source_directory is None:
                 src_tar = os.path.join(
                     args.archive,
                     'pressure-vessel{}-{}+src.tar.gz'.format(tail, bin_arch),
                 )
-                subprocess.check_call([
+                command = [
                     'tar',
+                    compress,
+                    # The source tarball has a copy of metadata/ in
+                    # sources/: rename it while archiving, instead of
+                    # copying it on disk first
+                    r'--transform=s,^\./metadata\(/\|$\),./sources\1,',
                     (r'--transform='
                      r's,^\(\.\(/\|$\)\)\?,pressure-vessel{}/,').format(
                         tail,
                     ),
-                    # metadata/ is all duplicated in sources/
-                    '--exclude=metadata',
-                    '-zcvf', src_tar + '.tmp',
+                    '-cf', src_tar + '.tmp',
                     '-C', installation,
                     '.',
-                ])
-            else:
-                src_tar = ''
-
-            subprocess.check_call([
-                'tar',
-                (r'--transform='
-                 r's,^\(\.\(/\|$\)\)\?,pressure-vessel{}/,').format(
-                    tail,
-                ),
-                '--exclude=sources',
-                '-zcvf', bin_tar + '.tmp',
-                '-C', installation,
-                '.',
-            ])
+                ]
+                print('# {}'.format(command))
+                futures.append(
+                    executor.submit(subprocess.check_call, command),
+                )
+
+            for future in futures:
+                future.result()
+
+        if bin_tar:
             os.rename(bin_tar + '.tmp', bin_tar)
             print('Generated {}'.format(os.path.abspath(bin_tar)))
 
-            if src_tar:
-                os.rename(src_tar + '.tmp', src_tar)
-                print('Generated {}'.format(os.path.abspath(src_tar)))
+        if src_tar:
+            os.rename(src_tar + '.tmp', src_tar)
+            print('Generated {}'.format(os.path.abspath(src_tar)))
 
 
 if __name__ == '__main__':
@@ -27,6 +27,7 @@ import argparse
 import contextlib
 import hashlib
 import logging
+import mmap
 import os
 import shlex
 import shutil
@@ -95,6 +96,27 @@ def SshMaster(
         logger.debug('Closed persistent ssh connection')
 
 
+def sha256_file(path: str) -> str:
+    '''
+    Return the SHA-256 of the file at path, as lower-case hex, letting
+    C code loop over the contents instead of reading them in Python.
+    '''
+    with open(path, 'rb', buffering=0) as reader:
+        if hasattr(hashlib, 'file_digest'):
+            # Python >= 3.11
+            return hashlib.file_digest(reader, 'sha256').hexdigest()
+
+        hasher = hashlib.sha256()
+
+        if os.fstat(reader.fileno()).st_size > 0:
+            with mmap.mmap(
+                reader.fileno(), 0, access=mmap.ACCESS_READ,
+            ) as mapped:
+                hasher.update(mapped)
+
+        return hasher.hexdigest()
+
+
 class Uploader:
     def __init__(
         self,
@@ -284,18 +306,9 @@ class Uploader:
 
         with open(str(upload / 'SHA256SUMS'), 'w') as text_writer:
             for f in sorted(to_hash):
-                hasher = hashlib.sha256()
-
-                with open(str(upload / f), 'rb') as binary_reader:
-                    while True:
-                        blob = binary_reader.read(4096)
-
-                        if not blob:
-                            break
-
-                        hasher.update(blob)
-
-                text_writer.write('{} *{}\n'.format(hasher.hexdigest(), f))
+                text_writer.write(
+                    '{} *{}\n'.format(sha256_file(str(upload / f)), f)
+                )
 
         with open(str(upload / 'VERSION.txt')) as reader:
             version = reader.read().strip()
@@ -58,28 +58,42 @@ class TestDialogUi(BaseTest):
             self.skipTest('Not available as an installed-test')
 
     def test_check_features(self) -> None:
-        for features, good in (
-            ('', True),
-            (' ', True),
-            ('message', True),
-            ('message progress', True),
-            ('message message\tmessage\nmessage', True),
-            ('bees', False),
-            ('message progress bees', False),
-        ):
-            proc = subprocess.Popen(
-                self.dialog_ui + [
-                    '--check-features', features,
-                ],
-                stdout=STDERR_FILENO,
-                stderr=STDERR_FILENO,
-            )
-            proc.wait()
-
-            if good:
-                self.assertEqual(proc.returncode, 0)
-            else:
-                self.assertEqual(proc.returncode, 255)
+        # The cases are independent, so start them all before waiting
+        # for any of them
+        procs = []
+
+        try:
+            for features, good in (
+                ('', True),
+                (' ', True),
+                ('message', True),
+                ('message progress', True),
+                ('message message\tmessage\nmessage', True),
+                ('bees', False),
+                ('message progress bees', False),
+            ):
+                proc = subprocess.Popen(
+                    self.dialog_ui + [
+                        '--check-features', features,
+                    ],
+                    stdout=STDERR_FILENO,
+                    stderr=STDERR_FILENO,
+                )
+                procs.append((proc, good))
+
+            for proc, good in procs:
+                proc.wait()
+
+                if good:
+                    self.assertEqual(proc.returncode, 0)
+                else:
+                    self.assertEqual(proc.returncode, 255)
+        finally:
+            # Don't leave processes behind if we failed early
+            for proc, good in procs:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
 
     def tearDown(self) -> None:
         super().tearDown()
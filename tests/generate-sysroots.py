@@ -28,6 +28,12 @@ import argparse
 import shutil
 import textwrap
 
+try:
+    import typing
+    typing      # noqa
+except ImportError:
+    pass
+
 parser = argparse.ArgumentParser()
 parser.add_argument("path")
 parser.add_argument(
@@ -168,9 +174,6 @@ ubuntu16/usr/lib/x86_64-mock-ubuntu/vdpau
 ubuntu16/sys/class/dmi/id
 '''
 
-for name in dirs.split():
-    os.makedirs(name, mode=0o755, exist_ok=True)
-
 files = ''
 
 for abi in supported_abis:
@@ -290,11 +293,12 @@ ubuntu16/usr/lib/x86_64-mock-ubuntu/vdpau/libvdpau_r600.so.1.0.0
 ubuntu16/usr/lib/x86_64-mock-ubuntu/vdpau/libvdpau_radeonsi.so.1.0.0
 '''     # noqa
 
-for name in files.split():
-    os.makedirs(os.path.dirname(name), mode=0o755, exist_ok=True)
-    open(name, 'w').close()
+# The lists above are easier to read and edit as text, but we only need
+# to split them into names once
+leaf_dirs = dirs.split()
+file_names = files.split()
 
-for name, target in {
+symlinks = {
     'debian10/lib/ld-linux.so.2':
         '/usr/lib/i386-linux-gnu/ld.so',
     'debian10/lib64/ld-linux-x86-64.so.2':
@@ -336,8 +340,38 @@ for name, target in {
         'libvdpau_radeonsi.so.1.0.0',
     'ubuntu16/usr/lib/x86_64-mock-ubuntu/vdpau/libvdpau_radeonsi.so.1':
         'libvdpau_radeonsi.so.1.0.0',
-}.items():
-    os.makedirs(os.path.dirname(name), mode=0o755, exist_ok=True)
+}
+
+# Create each directory just once, parents first, rather than having
+# os.makedirs() check every ancestor again for each file or symlink.
+# Like os.makedirs(name, mode=0o755), only the directories we ask for
+# get mode 0o755: ancestors that only exist implicitly get the default
+# mode, so the result is the same under any umask.
+directory_modes = {}    # type: typing.Dict[str, int]
+
+for name in (
+    leaf_dirs
+    + [os.path.dirname(f) for f in file_names]
+    + [os.path.dirname(link) for link in symlinks]
+):
+    mode = 0o755
+
+    while name and name not in directory_modes:
+        directory_modes[name] = mode
+        mode = 0o777
+        name = os.path.dirname(name)
+
+for name in sorted(directory_modes):
+    try:
+        os.mkdir(name, mode=directory_modes[name])
+    except FileExistsError:
+        pass
+
+for name in file_names:
+    # Create an empty file without going through Python's I/O stack
+    os.close(os.open(name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666))
+
+for name, target in symlinks.items():
     try:
         os.symlink(target, name)
     except FileExistsError:
@@ -551,8 +585,12 @@ with open(
   }
 }''')   # noqa
 
-with open('fake-icds/false.json', 'w') as writer:
-    writer.write('''false''')
+for name in (
+    'fake-icds/false.json',
+    'fake-icds-flatpak/false.json',
+):
+    with open(name, 'w') as writer:
+        writer.write('''false''')
 
 with open('fake-icds/no-api-version.json', 'w') as writer:
     writer.write('''\
@@ -638,13 +676,12 @@ with open('fake-icds/datahome/vulkan/icd.d/invalid.json', 'w') as writer:
     "file_format_version": "1.0.0"
 }''')
 
-with open('fake-icds/home/.config/vulkan/icd.d/invalid.json', 'w') as writer:
-    writer.write('''{ }''')
-
-with open(
-    'fake-icds/home/.local/share/vulkan/icd.d/invalid.json', 'w'
-) as writer:
-    writer.write('''{ }''')
+for name in (
+    'fake-icds/home/.config/vulkan/icd.d/invalid.json',
+    'fake-icds/home/.local/share/vulkan/icd.d/invalid.json',
+):
+    with open(name, 'w') as writer:
+        writer.write('''{ }''')
 
 with open('fake-icds/egl2/absolute.json', 'w') as writer:
     writer.write('''\
@@ -682,8 +719,12 @@ with open('fake-icds/egl2/soname_zlib.json', 'w') as writer:
     }
 }''')
 
-with open('fake-icds/etc/vulkan/icd.d/basename.json', 'w') as writer:
-    writer.write('''\
+for name in (
+    'fake-icds/etc/vulkan/icd.d/basename.json',
+    'fake-icds-flatpak/etc/vulkan/icd.d/basename.json',
+):
+    with open(name, 'w') as writer:
+        writer.write('''\
 {
     "ICD": {
         "api_version": "1.2.3",
@@ -692,10 +733,12 @@ with open('fake-icds/etc/vulkan/icd.d/basename.json', 'w') as writer:
     "file_format_version": "1.0.0"
 }''')
 
-with open(
-    'fake-icds/usr/lib/x86_64-mock-abi/vulkan/icd.d/relative.json', 'w'
-) as writer:
-    writer.write('''\
+for name in (
+    'fake-icds/usr/lib/x86_64-mock-abi/vulkan/icd.d/relative.json',
+    'fake-icds-flatpak/usr/lib/x86_64-mock-abi/vulkan/icd.d/relative.json',
+):
+    with open(name, 'w') as writer:
+        writer.write('''\
 {
     "ICD": {
         "api_version": "1.1.1",
@@ -704,11 +747,13 @@ with open(
     "file_format_version": "1.0.0"
 }''')
 
-with open(
+for name in (
     'fake-icds/usr/lib/x86_64-mock-abi/GL/glvnd/egl_vendor.d/relative.json',
-    'w',
-) as writer:
-    writer.write('''\
+    ('fake-icds-flatpak/usr/lib/x86_64-mock-abi/GL/glvnd/'
+     'egl_vendor.d/relative.json'),
+):
+    with open(name, 'w') as writer:
+        writer.write('''\
 {
     "ICD": {
         "library_path": "../libEGL_relative.so"
@@ -716,10 +761,12 @@ with open(
     "file_format_version": "1.0.0"
 }''')
 
-with open(
-    'fake-icds/usr/lib/x86_64-mock-abi/GL/vulkan/icd.d/invalid.json', 'w'
-) as writer:
-    writer.write('''[]''')
+for name in (
+    'fake-icds/usr/lib/x86_64-mock-abi/GL/vulkan/icd.d/invalid.json',
+    'fake-icds-flatpak/usr/lib/x86_64-mock-abi/GL/vulkan/icd.d/invalid.json',
+):
+    with open(name, 'w') as writer:
+        writer.write('''[]''')
 
 with open(
     'fake-icds/usr/local/share/vulkan/icd.d/intel_icd.i686.json', 'w'
@@ -745,10 +792,12 @@ with open(
     }
 }''')
 
-with open(
-    'fake-icds/usr/share/glvnd/egl_vendor.d/50_mesa.json', 'w'
-) as writer:
-    writer.write('''\
+for name in (
+    'fake-icds/usr/share/glvnd/egl_vendor.d/50_mesa.json',
+    'fake-icds-flatpak/usr/share/glvnd/egl_vendor.d/50_mesa.json',
+):
+    with open(name, 'w') as writer:
+        writer.write('''\
 {
     "file_format_version" : "1.0.0",
     "ICD" : {
@@ -756,10 +805,12 @@ with open(
     }
 }''')
 
-with open(
-    'fake-icds/usr/share/vulkan/icd.d/intel_icd.x86_64.json', 'w'
-) as writer:
-    writer.write('''\
+for name in (
+    'fake-icds/usr/share/vulkan/icd.d/intel_icd.x86_64.json',
+    'fake-icds-flatpak/usr/share/vulkan/icd.d/intel_icd.x86_64.json',
+):
+    with open(name, 'w') as writer:
+        writer.write('''\
 {
     "ICD": {
         "api_version": "1.1.102",
@@ -781,32 +832,6 @@ with open(
     "file_format_version": "1.0.0"
 }''')   # noqa
 
-with open('fake-icds-flatpak/etc/vulkan/icd.d/basename.json', 'w') as writer:
-    writer.write('''\
-{
-    "ICD": {
-        "api_version": "1.2.3",
-        "library_path": "libvulkan_basename.so"
-    },
-    "file_format_version": "1.0.0"
-}''')
-
-with open('fake-icds-flatpak/false.json', 'w') as writer:
-    writer.write('''false''')
-
-with open(
-    'fake-icds-flatpak/usr/lib/x86_64-mock-abi/vulkan/icd.d/relative.json',
-    'w',
-) as writer:
-    writer.write('''\
-{
-    "ICD": {
-        "api_version": "1.1.1",
-        "library_path": "../libvulkan_relative.so"
-    },
-    "file_format_version": "1.0.0"
-}''')
-
 with open(
     ('fake-icds-flatpak/usr/lib/extensions/vulkan/share/vulkan/'
      'explicit_layer.d/mr3398.json'),
@@ -899,19 +924,6 @@ with open(
     }
 }''')
 
-with open(
-    ('fake-icds-flatpak/usr/lib/x86_64-mock-abi/GL/glvnd/'
-     'egl_vendor.d/relative.json'),
-    'w',
-) as writer:
-    writer.write('''\
-{
-    "ICD": {
-        "library_path": "../libEGL_relative.so"
-    },
-    "file_format_version": "1.0.0"
-}''')
-
 with open(
     ('fake-icds-flatpak/usr/lib/x86_64-mock-abi/GL/vulkan/'
      'explicit_layer.d/glext.json'),
@@ -931,12 +943,6 @@ with open(
     }
 }''')
 
-with open(
-    'fake-icds-flatpak/usr/lib/x86_64-mock-abi/GL/vulkan/icd.d/invalid.json',
-    'w',
-) as writer:
-    writer.write('''[]''')
-
 with open(
     ('fake-icds-flatpak/usr/lib/x86_64-mock-abi/GL/vulkan/'
      'implicit_layer.d/glext.json'),
@@ -979,29 +985,6 @@ with open(
     "file_format_version": "1.0.0"
 }''')
 
-with open(
-    'fake-icds-flatpak/usr/share/glvnd/egl_vendor.d/50_mesa.json', 'w'
-) as writer:
-    writer.write('''\
-{
-    "file_format_version" : "1.0.0",
-    "ICD" : {
-        "library_path" : "libEGL_mesa.so.0"
-    }
-}''')
-
-with open(
-    'fake-icds-flatpak/usr/share/vulkan/icd.d/intel_icd.x86_64.json', 'w'
-) as writer:
-    writer.write('''\
-{
-    "ICD": {
-        "api_version": "1.1.102",
-        "library_path": "/usr/lib/x86_64-mock-abi/libvulkan_intel.so"
-    },
-    "file_format_version": "1.0.0"
-}''')
-
 for abi in supported_abis:
     symbols = ('fake-steam-runtime/usr/lib/steamrt/expectations/{}/'
                'libglib2.0-0.symbols').format(abi)